@@ -1,5 +1,7 @@
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Optional
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -8,6 +10,11 @@ load_dotenv()
 @dataclass
 class BotConfig:
     token: str
+    # количество процессов-воркеров (1 — обычный запуск в одном процессе)
+    workers: int = 1
+    # пороги монитора event loop, в секундах
+    loop_lag_slo: float = 0.2
+    slow_callback_threshold: float = 0.1
 
 
 @dataclass
@@ -17,20 +24,47 @@ class ApiConfig:
     password: str
 
 
+@dataclass
+class HistoryConfig:
+    path: str
+    start_date: date
+
+
+@dataclass
+class ReportExecutorConfig:
+    # inline / thread / process
+    kind: str = "inline"
+    max_workers: Optional[int] = None
+    # с какого объёма (сколько чисел агрегируем) уносить работу в пул
+    threshold: int = 10000
+
+
 @dataclass
 class Config:
     bot: BotConfig
     api: ApiConfig
+    history: Optional[HistoryConfig] = None
+    # куда писать трейс трафика для app.replay (None — не пишем)
+    trace_path: Optional[str] = None
+    report_executor: ReportExecutorConfig = field(default_factory=ReportExecutorConfig)
 
 
-def load_config() -> Config:
-    bot_token = os.getenv("BOT_TOKEN")
-    if not bot_token:
+def load_config(require_credentials: bool = True) -> Config:
+    """
+    require_credentials=False — для app.replay: токен и доступы к API
+    там не нужны, а остальные настройки читаются так же, как у бота.
+    """
+    bot_token = os.getenv("BOT_TOKEN", "")
+    if require_credentials and not bot_token:
         raise ValueError("BOT_TOKEN is missing in .env")
 
-    api_user = os.getenv("API_USER")
-    api_pass = os.getenv("API_PASS")
-    if not api_user or not api_pass:
+    workers = int(os.getenv("BOT_WORKERS", "1"))
+    loop_lag_slo = int(os.getenv("LOOP_LAG_SLO_MS", "200")) / 1000
+    slow_callback_threshold = int(os.getenv("SLOW_CALLBACK_MS", "100")) / 1000
+
+    api_user = os.getenv("API_USER", "")
+    api_pass = os.getenv("API_PASS", "")
+    if require_credentials and (not api_user or not api_pass):
         raise ValueError("API_USER/API_PASS are missing in .env")
 
     api_url = os.getenv(
@@ -38,11 +72,40 @@ def load_config() -> Config:
         "https://api.hse.panfilov.app/channel-stats",
     )
 
+    # локальная история статистики включается, только если задан путь
+    history = None
+    history_path = os.getenv("HISTORY_PATH")
+    if history_path:
+        history_start = os.getenv("HISTORY_START_DATE")
+        history = HistoryConfig(
+            path=history_path,
+            start_date=(
+                date.fromisoformat(history_start)
+                if history_start
+                else date.today() - timedelta(days=730)
+            ),
+        )
+
+    report_workers = os.getenv("REPORT_EXECUTOR_WORKERS")
+    report_executor = ReportExecutorConfig(
+        kind=os.getenv("REPORT_EXECUTOR", "inline"),
+        max_workers=int(report_workers) if report_workers else None,
+        threshold=int(os.getenv("REPORT_OFFLOAD_THRESHOLD", "10000")),
+    )
+
     return Config(
-        bot=BotConfig(token=bot_token),
+        bot=BotConfig(
+            token=bot_token,
+            workers=workers,
+            loop_lag_slo=loop_lag_slo,
+            slow_callback_threshold=slow_callback_threshold,
+        ),
         api=ApiConfig(
             base_url=api_url,
             user=api_user,
             password=api_pass,
         ),
+        history=history,
+        trace_path=os.getenv("TRACE_PATH") or None,
+        report_executor=report_executor,
     )
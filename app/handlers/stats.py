@@ -1,4 +1,7 @@
+import asyncio
+import logging
 from datetime import date, timedelta, datetime
+from typing import Any, Coroutine, Dict, List, Optional, Set, Tuple
 
 from aiogram import Router, types, F
 from aiogram.exceptions import TelegramBadRequest
@@ -7,6 +10,8 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 
 from app.services.hse_client import HseApiClient
+from app.services.history import StatsHistory, history_channel_range
+from app.services.report_executor import ReportExecutor
 from app.config import Config
 from app.keyboards.stats import (
     channels_keyboard,
@@ -14,8 +19,17 @@ from app.keyboards.stats import (
     main_menu_keyboard,
 )
 
+logger = logging.getLogger(__name__)
+
 router = Router()
 
+LOADING_TEXT = "⏳ Загружаю статистику..."
+
+# фоновые задачи, которые досчитывают ответ на нажатие кнопки
+_background_tasks: Set[asyncio.Task] = set()
+# сообщения (chat_id, message_id), для которых отчёт ещё считается
+_inflight_reports: Set[Tuple[int, int]] = set()
+
 
 class StatsRange(StatesGroup):
     waiting_for_start_date = State()
@@ -51,6 +65,49 @@ def build_total_stats_text(data, date_label: str) -> str:
     return text
 
 
+def compact_stats_rows(data) -> List[Tuple[str, int, int, int]]:
+    """Ответ API -> кортежи (канал, посты, просмотры, пересылки) для пула."""
+    return [
+        (ch["channel_name"], ch["total_posts"], ch["total_views"], ch["total_forwards"])
+        for ch in data
+    ]
+
+
+def build_total_stats_text_from_rows(rows, date_label: str) -> str:
+    data = [
+        {
+            "channel_name": name,
+            "total_posts": posts,
+            "total_views": views,
+            "total_forwards": forwards,
+        }
+        for name, posts, views, forwards in rows
+    ]
+    return build_total_stats_text(data, date_label)
+
+
+async def render_total_stats(
+    report_executor: Optional[ReportExecutor],
+    data: List[Dict[str, Any]],
+    date_label: str,
+) -> str:
+    # по каждому каналу агрегируем три числа
+    size = len(data) * 3
+    if report_executor is None or not report_executor.offloads(size):
+        return build_total_stats_text(data, date_label)
+    if report_executor.kind != "process":
+        # поток видит те же словари — перекладывать их незачем
+        return await report_executor.run(
+            build_total_stats_text, data, date_label, size=size
+        )
+    # в процесс отдаём кортежи, но и их собираем не в loop
+    loop = asyncio.get_running_loop()
+    rows = await loop.run_in_executor(None, compact_stats_rows, data)
+    return await report_executor.run(
+        build_total_stats_text_from_rows, rows, date_label, size=size
+    )
+
+
 def build_channel_stats_text(
     channel_name: str,
     total_posts: int,
@@ -73,7 +130,146 @@ def build_channel_stats_text(
     return text
 
 
-def setup_stats_handlers(router: Router, api_client: HseApiClient, config: Config):
+def _on_background_done(task: asyncio.Task):
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(
+            "Background stats task failed", exc_info=task.exception()
+        )
+
+
+def run_in_background(coro: Coroutine) -> asyncio.Task:
+    """
+    Запускает тяжёлую часть обработки кнопки отдельной задачей,
+    чтобы callback можно было подтвердить сразу.
+    Ссылку держим в _background_tasks, иначе задачу может съесть GC.
+    """
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_on_background_done)
+    return task
+
+
+async def start_report_job(callback: types.CallbackQuery, job: Coroutine):
+    """
+    Сразу подтверждает нажатие, ставит "загрузку" и отдаёт тяжёлую часть
+    в фон. Повторное нажатие, пока отчёт для этого сообщения ещё считается,
+    второй задачи не запускает.
+    """
+    key = (callback.message.chat.id, callback.message.message_id)
+    if key in _inflight_reports:
+        job.close()
+        await callback.answer(
+            "Уже показываю актуальную статистику 👍", show_alert=False
+        )
+        return
+
+    # помечаем до первого await, чтобы два быстрых нажатия не проскочили
+    _inflight_reports.add(key)
+    try:
+        await callback.answer()
+        await safe_edit_text(callback.message, LOADING_TEXT)
+    except Exception:
+        _inflight_reports.discard(key)
+        job.close()
+        raise
+    task = run_in_background(job)
+    task.add_done_callback(lambda _: _inflight_reports.discard(key))
+
+
+async def wait_background_tasks():
+    """Дождаться фоновых задач (вызывается при остановке бота)."""
+    if _background_tasks:
+        await asyncio.gather(*_background_tasks, return_exceptions=True)
+
+
+async def safe_edit_text(message: types.Message, text: str, **kwargs):
+    try:
+        await message.edit_text(text, **kwargs)
+    except TelegramBadRequest as e:
+        # Телеграм говорит "message is not modified" — просто игнорируем
+        if "message is not modified" in str(e):
+            return
+        # любая другая ошибка — пусть падает
+        raise
+
+
+async def fetch_day_stats(
+    api_client: HseApiClient,
+    history: Optional[StatsHistory],
+    for_date: date,
+) -> List[Dict[str, Any]]:
+    """get_channel_stats + запись законченного дня в локальную историю."""
+    data = await api_client.get_channel_stats(for_date)
+    # данные младше лага в 2 дня могут ещё меняться, а пустой ответ значит,
+    # что данных пока нет, — такие дни не сохраняем
+    if history is not None and data and for_date <= date.today() - timedelta(days=2):
+        history.append_day(for_date, data)
+    return data
+
+
+async def collect_channel_totals(
+    api_client: HseApiClient,
+    history: Optional[StatsHistory],
+    channel: str,
+    start_date: date,
+    end_date: date,
+    report_executor: Optional[ReportExecutor] = None,
+) -> Tuple[int, int, int]:
+    """
+    Суммы (posts, views, forwards) по каналу за диапазон дат.
+    Дни, которые уже есть в локальной истории, читаем оттуда,
+    за остальными идём в API и заодно дописываем их в историю.
+    """
+    total_posts = 0
+    total_views = 0
+    total_forwards = 0
+    missing_dates = None
+
+    if history is not None:
+        size = ((end_date - start_date).days + 1) * 3
+        if report_executor is not None and report_executor.offloads(size):
+            # в пул передаём только путь: mmap откроется на стороне воркера
+            covered = await report_executor.run(
+                history_channel_range,
+                history.path,
+                channel,
+                start_date,
+                end_date,
+                size=size,
+            )
+        else:
+            covered = history.channel_range(channel, start_date, end_date)
+        if covered is not None:
+            (total_posts, total_views, total_forwards), missing_dates = covered
+
+    if missing_dates is None:
+        missing_dates = [
+            start_date + timedelta(days=i)
+            for i in range((end_date - start_date).days + 1)
+        ]
+
+    for cur_date in missing_dates:
+        day_data = await fetch_day_stats(api_client, history, cur_date)
+        ch_data = next(
+            (item for item in day_data if item["channel_name"] == channel),
+            None,
+        )
+        if ch_data:
+            total_posts += ch_data["total_posts"]
+            total_views += ch_data["total_views"]
+            total_forwards += ch_data["total_forwards"]
+
+    return total_posts, total_views, total_forwards
+
+
+def setup_stats_handlers(
+    router: Router,
+    api_client: HseApiClient,
+    config: Config,
+    history: Optional[StatsHistory] = None,
+    report_executor: Optional[ReportExecutor] = None,
+):
     # ===== /stats (общая статистика по дате) =====
     @router.message(Command("stats"))
     async def stats_command_handler(message: types.Message):
@@ -93,7 +289,7 @@ def setup_stats_handlers(router: Router, api_client: HseApiClient, config: Confi
             date_str = target_date.isoformat()
 
         try:
-            data = await api_client.get_channel_stats(target_date)
+            data = await fetch_day_stats(api_client, history, target_date)
         except Exception as e:
             await message.answer(f"❌ Ошибка при запросе API: {e}")
             return
@@ -102,44 +298,30 @@ def setup_stats_handlers(router: Router, api_client: HseApiClient, config: Confi
             await message.answer(f"Нет данных за {date_str}.")
             return
 
-        text = build_total_stats_text(data, date_str)
+        text = await render_total_stats(report_executor, data, date_str)
         await message.answer(text, reply_markup=main_menu_keyboard())
 
     # ===== Кнопка "Общая статистика" =====
-    @router.callback_query(F.data == "stats:total")
-    async def stats_total_callback(callback: types.CallbackQuery):
+    async def stats_total_job(message: types.Message):
         target_date = date.today() - timedelta(days=2)
         date_str = target_date.isoformat()
 
         try:
-            data = await api_client.get_channel_stats(target_date)
+            data = await fetch_day_stats(api_client, history, target_date)
         except Exception as e:
-            await callback.message.edit_text(
-                f"❌ Ошибка при запросе API: {e}"
-            )
-            await callback.answer()
+            await safe_edit_text(message, f"❌ Ошибка при запросе API: {e}")
             return
 
         if not data:
-            await callback.message.edit_text(f"Нет данных за {date_str}.")
-            await callback.answer()
+            await safe_edit_text(message, f"Нет данных за {date_str}.")
             return
 
-        text = build_total_stats_text(data, date_str)
+        text = await render_total_stats(report_executor, data, date_str)
+        await safe_edit_text(message, text, reply_markup=main_menu_keyboard())
 
-        try:
-            await callback.message.edit_text(text, reply_markup=main_menu_keyboard())
-        except TelegramBadRequest as e:
-            # Телеграм говорит "message is not modified" — просто игнорируем
-            if "message is not modified" in str(e):
-                await callback.answer(
-                    "Уже показываю актуальную статистику 👍", show_alert=False
-                )
-                return
-            # любая другая ошибка — пусть падает
-            raise
-
-        await callback.answer()
+    @router.callback_query(F.data == "stats:total")
+    async def stats_total_callback(callback: types.CallbackQuery):
+        await start_report_job(callback, stats_total_job(callback.message))
 
     # ===== Кнопка "Статистика по паблику" =====
     @router.callback_query(F.data == "stats:by_channel")
@@ -161,17 +343,14 @@ def setup_stats_handlers(router: Router, api_client: HseApiClient, config: Confi
         await callback.answer()
 
     # ===== Период: последний день =====
-    @router.callback_query(F.data.startswith("period:day:"))
-    async def period_day_callback(callback: types.CallbackQuery):
-        _, _, channel = callback.data.split(":", 2)
+    async def period_day_job(message: types.Message, channel: str):
         target_date = date.today() - timedelta(days=2)
         date_str = target_date.isoformat()
 
         try:
-            data = await api_client.get_channel_stats(target_date)
+            data = await fetch_day_stats(api_client, history, target_date)
         except Exception as e:
-            await callback.message.edit_text(f"❌ Ошибка при запросе API: {e}")
-            await callback.answer()
+            await safe_edit_text(message, f"❌ Ошибка при запросе API: {e}")
             return
 
         ch_data = next(
@@ -180,10 +359,9 @@ def setup_stats_handlers(router: Router, api_client: HseApiClient, config: Confi
         )
 
         if not ch_data:
-            await callback.message.edit_text(
-                f"Нет данных для канала {channel} за {date_str}."
+            await safe_edit_text(
+                message, f"Нет данных для канала {channel} за {date_str}."
             )
-            await callback.answer()
             return
 
         text = build_channel_stats_text(
@@ -193,44 +371,32 @@ def setup_stats_handlers(router: Router, api_client: HseApiClient, config: Confi
             total_forwards=ch_data["total_forwards"],
             date_label=date_str,
         )
-        await callback.message.edit_text(text, parse_mode="HTML")
-        await callback.answer()
+        await safe_edit_text(message, text, parse_mode="HTML")
 
-    # ===== Период: последняя неделя =====
-    @router.callback_query(F.data.startswith("period:week:"))
-    async def period_week_callback(callback: types.CallbackQuery):
+    @router.callback_query(F.data.startswith("period:day:"))
+    async def period_day_callback(callback: types.CallbackQuery):
         _, _, channel = callback.data.split(":", 2)
+        await start_report_job(callback, period_day_job(callback.message, channel))
+
+    # ===== Период: последняя неделя =====
+    async def period_week_job(message: types.Message, channel: str):
         end_date = date.today() - timedelta(days=2)
         start_date = end_date - timedelta(days=6)  # 7 дней всего
 
-        total_posts = 0
-        total_views = 0
-        total_forwards = 0
-
-        cur_date = start_date
         try:
-            while cur_date <= end_date:
-                day_data = await api_client.get_channel_stats(cur_date)
-                ch_data = next(
-                    (item for item in day_data if item["channel_name"] == channel),
-                    None,
-                )
-                if ch_data:
-                    total_posts += ch_data["total_posts"]
-                    total_views += ch_data["total_views"]
-                    total_forwards += ch_data["total_forwards"]
-                cur_date += timedelta(days=1)
+            total_posts, total_views, total_forwards = await collect_channel_totals(
+                api_client, history, channel, start_date, end_date, report_executor
+            )
         except Exception as e:
-            await callback.message.edit_text(f"❌ Ошибка при запросе API: {e}")
-            await callback.answer()
+            await safe_edit_text(message, f"❌ Ошибка при запросе API: {e}")
             return
 
         if total_posts == 0:
-            await callback.message.edit_text(
+            await safe_edit_text(
+                message,
                 f"Нет данных для канала {channel} за период "
-                f"{start_date.isoformat()} — {end_date.isoformat()}."
+                f"{start_date.isoformat()} — {end_date.isoformat()}.",
             )
-            await callback.answer()
             return
 
         date_label = f"{start_date.isoformat()} — {end_date.isoformat()}"
@@ -241,8 +407,12 @@ def setup_stats_handlers(router: Router, api_client: HseApiClient, config: Confi
             total_forwards=total_forwards,
             date_label=date_label,
         )
-        await callback.message.edit_text(text, parse_mode="HTML")
-        await callback.answer()
+        await safe_edit_text(message, text, parse_mode="HTML")
+
+    @router.callback_query(F.data.startswith("period:week:"))
+    async def period_week_callback(callback: types.CallbackQuery):
+        _, _, channel = callback.data.split(":", 2)
+        await start_report_job(callback, period_week_job(callback.message, channel))
 
     # ===== Период: пользовательский диапазон (кнопка) =====
     @router.callback_query(F.data.startswith("period:custom:"))
@@ -311,23 +481,10 @@ def setup_stats_handlers(router: Router, api_client: HseApiClient, config: Confi
             )
             return
 
-        total_posts = 0
-        total_views = 0
-        total_forwards = 0
-
-        cur_date = start_date
         try:
-            while cur_date <= end_date:
-                day_data = await api_client.get_channel_stats(cur_date)
-                ch_data = next(
-                    (item for item in day_data if item["channel_name"] == channel),
-                    None,
-                )
-                if ch_data:
-                    total_posts += ch_data["total_posts"]
-                    total_views += ch_data["total_views"]
-                    total_forwards += ch_data["total_forwards"]
-                cur_date += timedelta(days=1)
+            total_posts, total_views, total_forwards = await collect_channel_totals(
+                api_client, history, channel, start_date, end_date, report_executor
+            )
         except Exception as e:
             await message.answer(f"❌ Ошибка при запросе API: {e}")
             await state.clear()
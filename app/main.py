@@ -1,30 +1,137 @@
 import asyncio
+import logging
+import os
 
 from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.memory import MemoryStorage
 
-from app.config import load_config
+from app.config import Config, load_config
 from app.handlers import start as start_handlers
 from app.handlers import stats as stats_handlers
+from app.keyboards.stats import CHANNELS
 from app.services.hse_client import HseApiClient
+from app.services.history import StatsHistory
+from app.services.loop_monitor import LoopMonitor
+from app.services.report_executor import ReportExecutor
+from app.services.tracing import TraceRecorder, TraceUpdateMiddleware
+from app.sharding import ShardSupervisor
+
+
+def report_pool_size(config: Config):
+    """
+    Размер пула отчётов. При шардинге пул есть в каждом воркере,
+    поэтому по умолчанию делим ядра между воркерами.
+    """
+    if config.report_executor.max_workers:
+        return config.report_executor.max_workers
+    if config.bot.workers > 1:
+        return max(1, (os.cpu_count() or 1) // config.bot.workers)
+    return None
+
+
+def register_routers(
+    dp: Dispatcher,
+    config: Config,
+    api_client,
+    history=None,
+    report_executor=None,
+):
+    dp.include_router(start_handlers.router)
+    stats_handlers.setup_stats_handlers(
+        stats_handlers.router, api_client, config, history, report_executor)
+    dp.include_router(stats_handlers.router)
+
+
+def resolve_update_types(config: Config):
+    """
+    Типы апдейтов, которые обрабатывают роутеры. Диспетчер собирается
+    без истории, пула и трейса: хендлеры здесь не вызываются.
+    """
+    dp = Dispatcher()
+    register_routers(dp, config, HseApiClient(config))
+    return dp.resolve_used_update_types()
+
+
+def build_dispatcher(config: Config, api_client=None) -> Dispatcher:
+    """
+    Собирает диспетчер со всеми роутерами.
+    api_client можно подменить (так делает app.replay).
+    """
+    dp = Dispatcher(storage=MemoryStorage())
+
+    if api_client is None:
+        recorder = None
+        if config.trace_path:
+            recorder = TraceRecorder(config.trace_path)
+            dp.update.outer_middleware(TraceUpdateMiddleware(recorder))
+        api_client = HseApiClient(config, recorder)
+
+    history = None
+    if config.history:
+        history = StatsHistory.open(
+            config.history.path,
+            channels=CHANNELS,
+            start_date=config.history.start_date,
+        )
+
+    report_executor = ReportExecutor(
+        kind=config.report_executor.kind,
+        max_workers=report_pool_size(config),
+        threshold=config.report_executor.threshold,
+    )
+
+    register_routers(dp, config, api_client, history, report_executor)
+    # при остановке даём досчитаться ответам на уже нажатые кнопки,
+    # и только потом гасим пул
+    dp.shutdown.register(stats_handlers.wait_background_tasks)
+    dp.shutdown.register(report_executor.shutdown)
+    return dp
+
+
+def build_loop_monitor(config: Config) -> LoopMonitor:
+    return LoopMonitor(
+        slow_callback_threshold=config.bot.slow_callback_threshold,
+        lag_slo=config.bot.loop_lag_slo,
+    )
 
 
 async def run_bot():
+    logging.basicConfig(level=logging.INFO)
     config = load_config()
 
     bot = Bot(token=config.bot.token)
-    dp = Dispatcher(storage=MemoryStorage())
+    dp = build_dispatcher(config)
 
-    api_client = HseApiClient(config)
+    # монитор event loop: lag, медленные колбэки, перепись задач
+    monitor = build_loop_monitor(config)
+    monitor.start()
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await monitor.stop()
 
-    # регистрируем роутеры
-    dp.include_router(start_handlers.router)
-    stats_handlers.setup_stats_handlers(
-        stats_handlers.router, api_client, config)
-    dp.include_router(stats_handlers.router)
 
-    await dp.start_polling(bot)
+async def run_sharded_bot(workers: int):
+    """
+    Супервизор: один процесс забирает апдейты, N воркеров их обрабатывают.
+    Апдейты одного чата всегда уходят в один и тот же воркер.
+    """
+    logging.basicConfig(level=logging.INFO)
+    config = load_config()
+
+    bot = Bot(token=config.bot.token)
+    allowed_updates = resolve_update_types(config)
+
+    supervisor = ShardSupervisor(workers, build_dispatcher)
+    try:
+        await supervisor.run_polling(bot, allowed_updates=allowed_updates)
+    finally:
+        await bot.session.close()
 
 
 if __name__ == "__main__":
-    asyncio.run(run_bot())
+    config = load_config()
+    if config.bot.workers > 1:
+        asyncio.run(run_sharded_bot(config.bot.workers))
+    else:
+        asyncio.run(run_bot())
@@ -0,0 +1,284 @@
+"""
+Проигрывание записанного трафика (см. TRACE_PATH и app.services.tracing)
+через настоящий Dispatcher с подменённым API и Telegram.
+
+    python -m app.replay run trace.jsonl --speed 2 --out before.json
+    python -m app.replay compare before.json after.json
+"""
+import argparse
+import asyncio
+import json
+import time
+from contextvars import ContextVar
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiogram.types import Chat, Message
+
+from app.config import load_config
+from app.main import build_dispatcher
+from app.services.loop_monitor import LoopMonitor
+from app.services.tracing import read_trace
+from app.sharding import extract_chat_id
+
+REPLAY_TOKEN = "42:REPLAY"
+
+
+class ReplayApiClient:
+    """
+    Подмена HseApiClient: отдаёт записанные ответы с записанной задержкой.
+    Для каждого относительного дня вызовы отдаются в том порядке, в каком
+    были записаны (по кругу, если при проигрывании их больше), поэтому
+    сохраняются и разброс задержек, и отдельные ошибки API.
+    """
+
+    def __init__(self, events: List[Dict[str, Any]], speed: float):
+        self._speed = speed
+        self._responses: Dict[int, List[Dict[str, Any]]] = {}
+        for event in events:
+            if event["kind"] == "api":
+                self._responses.setdefault(event["days_ago"], []).append(event)
+        self.calls: Dict[int, int] = {}
+        self.missing = 0
+
+    async def get_channel_stats(self, for_date: date) -> List[Dict[str, Any]]:
+        days_ago = (date.today() - for_date).days
+        served = self.calls.get(days_ago, 0)
+        self.calls[days_ago] = served + 1
+
+        recorded = self._responses.get(days_ago)
+        if not recorded:
+            self.missing += 1
+            return []
+
+        event = recorded[served % len(recorded)]
+        await asyncio.sleep(event["duration"] / self._speed)
+        if event.get("error") is not None:
+            # таймаут / обрыв соединения при записи
+            raise RuntimeError(event["error"])
+        if event["status"] != 200:
+            raise RuntimeError(f"API error: HTTP {event['status']}")
+        return event["response"]
+
+
+class _UpdateTiming:
+    def __init__(self, started: float):
+        self.started = started
+        self.first_response: Optional[float] = None
+        self.completed: Optional[float] = None
+
+
+# апдейт, в обработке которого идёт текущий вызов Telegram API.
+# Контекст копируется в задачу feed_raw_update и дальше во все фоновые
+# задачи хендлера, так что отложенный editMessageText попадает своему апдейту.
+_current_update: ContextVar[Optional[_UpdateTiming]] = ContextVar(
+    "replay_current_update", default=None
+)
+
+
+class ReplaySession(BaseSession):
+    """
+    Подмена сессии Telegram: ничего никуда не отправляет, а только
+    отмечает, когда бот ответил в чат. Каждый вызов засчитывается апдейту,
+    в обработке которого он сделан (включая фоновые задачи хендлера);
+    для вызовов вне контекста — по callback id, сообщению или чату.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._message_id = 0
+        self._callbacks: Dict[str, _UpdateTiming] = {}
+        self._messages: Dict[Tuple[int, int], _UpdateTiming] = {}
+        self._open: Dict[int, _UpdateTiming] = {}
+        self.timings: List[_UpdateTiming] = []
+
+    def begin_update(self, raw_update: Dict[str, Any]) -> _UpdateTiming:
+        timing = _UpdateTiming(time.perf_counter())
+        self._open[extract_chat_id(raw_update)] = timing
+        callback = raw_update.get("callback_query")
+        if callback:
+            self._callbacks[callback["id"]] = timing
+            message = callback.get("message")
+            if message:
+                key = (message["chat"]["id"], message["message_id"])
+                self._messages[key] = timing
+        self.timings.append(timing)
+        return timing
+
+    def _mark(self, method: TelegramMethod):
+        timing = _current_update.get()
+        if timing is None:
+            timing = self._callbacks.get(getattr(method, "callback_query_id", None))
+        chat_id = getattr(method, "chat_id", None)
+        if timing is None:
+            timing = self._messages.get((chat_id, getattr(method, "message_id", None)))
+        if timing is None:
+            timing = self._open.get(chat_id)
+        if timing is None:
+            return
+        now = time.perf_counter()
+        if timing.first_response is None:
+            timing.first_response = now
+        timing.completed = now
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout=None):
+        self._mark(method)
+        if method.__returning__ is bool:
+            return True
+        # sendMessage / editMessageText и т.п. — возвращаем правдоподобное сообщение
+        self._message_id += 1
+        return Message(
+            message_id=self._message_id,
+            date=datetime.now(),
+            chat=Chat(id=getattr(method, "chat_id", None) or 0, type="private"),
+            text=getattr(method, "text", None),
+        )
+
+    def stream_content(self, url, headers=None, timeout=30,
+                       chunk_size=65536, raise_for_status=True):
+        # метод абстрактный в BaseSession; хендлеры бота файлы не скачивают,
+        # поэтому при проигрывании это всегда ошибка
+        raise RuntimeError("Replay session does not download files")
+
+    async def close(self):
+        pass
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    values = sorted(values)
+
+    def pick(q: float) -> float:
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    return {
+        "p50": pick(0.50),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": values[-1],
+    }
+
+
+async def replay(trace_path: str, speed: float = 1.0) -> Dict[str, Any]:
+    if speed <= 0:
+        raise ValueError("speed must be > 0")
+
+    events = read_trace(trace_path)
+    updates = [event for event in events if event["kind"] == "update"]
+
+    # HISTORY_PATH, REPORT_EXECUTOR* и т.п. берутся из окружения, как у бота,
+    # чтобы сравнивать не только сборки, но и настройки
+    config = load_config(require_credentials=False)
+    api_client = ReplayApiClient(events, speed)
+    session = ReplaySession()
+    bot = Bot(token=REPLAY_TOKEN, session=session)
+    dp = build_dispatcher(config, api_client=api_client)
+
+    monitor = LoopMonitor(interval=0.05)
+    monitor.start()
+
+    tasks = []
+    started = time.perf_counter()
+    first_ts = updates[0]["ts"] if updates else 0.0
+    for event in updates:
+        delay = (event["ts"] - first_ts) / speed - (time.perf_counter() - started)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        token = _current_update.set(session.begin_update(event["update"]))
+        tasks.append(asyncio.create_task(dp.feed_raw_update(bot, event["update"])))
+        _current_update.reset(token)
+
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await dp.emit_shutdown(bot=bot)
+    wall_time = time.perf_counter() - started
+    await monitor.stop()
+    loop_stats = monitor.snapshot()
+
+    first_response = [
+        t.first_response - t.started
+        for t in session.timings
+        if t.first_response is not None
+    ]
+    completion = [
+        t.completed - t.started for t in session.timings if t.completed is not None
+    ]
+    return {
+        "trace": trace_path,
+        "speed": speed,
+        "updates": len(updates),
+        "unanswered": len(updates) - len(completion),
+        "wall_time": wall_time,
+        "first_response": _percentiles(first_response),
+        "completion": _percentiles(completion),
+        "loop": {
+            "lag_max": loop_stats["loop_lag_max"],
+            "slow_callbacks": loop_stats["slow_callbacks"],
+        },
+        "upstream_calls": sum(api_client.calls.values()),
+        "upstream_missing": api_client.missing,
+        "upstream_by_days_ago": {
+            str(days_ago): count
+            for days_ago, count in sorted(api_client.calls.items())
+        },
+    }
+
+
+def _flatten(result: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in result.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(before: Dict[str, Any], after: Dict[str, Any]) -> str:
+    """Таблица различий по латенси и запросам в API между двумя прогонами."""
+    a = _flatten(before)
+    b = _flatten(after)
+    lines = [f"{'metric':40} {'before':>12} {'after':>12} {'delta':>9}"]
+    for key in sorted(set(a) | set(b)):
+        old = a.get(key, 0)
+        new = b.get(key, 0)
+        delta = f"{(new - old) / old * 100:+.1f}%" if old else "—"
+        lines.append(f"{key:40} {old:>12.4g} {new:>12.4g} {delta:>9}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded bot traffic")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="проиграть трейс")
+    run_parser.add_argument("trace")
+    run_parser.add_argument("--speed", type=float, default=1.0)
+    run_parser.add_argument("--out")
+
+    compare_parser = sub.add_parser("compare", help="сравнить два прогона")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        result = asyncio.run(replay(args.trace, args.speed))
+        text = json.dumps(result, ensure_ascii=False, indent=2)
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                f.write(text)
+        print(text)
+    else:
+        with open(args.before, encoding="utf-8") as f:
+            before = json.load(f)
+        with open(args.after, encoding="utf-8") as f:
+            after = json.load(f)
+        print(compare(before, after))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+import fcntl
+import json
+import mmap
+import os
+from array import array
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# колонки хранятся как int64, по одному файлу на метрику
+COLUMNS = ("posts", "views", "forwards")
+ITEM_FORMAT = "q"
+ITEM_SIZE = array(ITEM_FORMAT).itemsize
+# день, за который ещё нет данных, заполнен этим значением во всех колонках
+MISSING = -1
+
+META_FILE = "meta.json"
+
+
+class StatsHistory:
+    """
+    Колоночное хранилище дневной статистики каналов.
+
+    Каталог содержит meta.json (дата начала и список каналов) и по одному
+    бинарному файлу на колонку: posts.i64, views.i64, forwards.i64.
+    Каждая колонка — плоский массив int64, индекс = день * число_каналов + канал.
+    Новые дни дописываются в конец, чтение идёт через mmap без копирования.
+    """
+
+    def __init__(self, path: str, start_date: date, channels: List[str]):
+        self.path = path
+        self.start_date = start_date
+        self.channels = list(channels)
+        self._channel_index = {name: i for i, name in enumerate(self.channels)}
+        self._maps: Dict[str, mmap.mmap] = {}
+        self._views: Dict[str, memoryview] = {}
+        self._mapped_size = 0
+
+    # ===== Открытие / создание =====
+
+    @classmethod
+    def open(
+        cls,
+        path: str,
+        channels: Optional[List[str]] = None,
+        start_date: Optional[date] = None,
+    ) -> "StatsHistory":
+        meta_path = os.path.join(path, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            history = cls(
+                path, date.fromisoformat(meta["start_date"]), meta["channels"]
+            )
+        else:
+            if not channels or start_date is None:
+                raise ValueError(
+                    "channels and start_date are required to create a new history"
+                )
+            os.makedirs(path, exist_ok=True)
+            for column in COLUMNS:
+                open(history_column_path(path, column), "ab").close()
+            # пишем через временный файл: другой воркер может в этот же момент
+            # открывать историю и не должен увидеть недописанный meta.json
+            tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"start_date": start_date.isoformat(), "channels": list(channels)},
+                    f,
+                )
+            os.replace(tmp_path, meta_path)
+            history = cls(path, start_date, channels)
+        history.refresh()
+        return history
+
+    def close(self):
+        for view in self._views.values():
+            view.release()
+        for mm in self._maps.values():
+            mm.close()
+        self._views.clear()
+        self._maps.clear()
+        self._mapped_size = 0
+
+    # ===== Чтение =====
+
+    @property
+    def _row_size(self) -> int:
+        return len(self.channels)
+
+    @property
+    def days(self) -> int:
+        """Сколько дней сейчас лежит в файлах (включая пропуски)."""
+        return self._mapped_size // (ITEM_SIZE * self._row_size)
+
+    def refresh(self):
+        """Перемапить файлы, если другой процесс дописал новые дни."""
+        # append_day удлиняет колонки по очереди, поэтому читаем размеры
+        # под общей блокировкой и на всякий случай берём минимальный
+        with open(os.path.join(self.path, META_FILE), "rb") as lock:
+            fcntl.flock(lock, fcntl.LOCK_SH)
+            try:
+                size = min(
+                    os.path.getsize(history_column_path(self.path, column))
+                    for column in COLUMNS
+                )
+                if size == self._mapped_size:
+                    return
+                self.close()
+                if size == 0:
+                    return
+                for column in COLUMNS:
+                    with open(history_column_path(self.path, column), "rb") as f:
+                        mm = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+                    self._maps[column] = mm
+                    self._views[column] = memoryview(mm).cast(ITEM_FORMAT)
+                self._mapped_size = size
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _day_offset(self, for_date: date) -> int:
+        return (for_date - self.start_date).days
+
+    def column(self, name: str, start: date, end: date) -> memoryview:
+        """Срез колонки за дни [start, end] — без копирования."""
+        first = self._day_offset(start) * self._row_size
+        last = (self._day_offset(end) + 1) * self._row_size
+        return self._views[name][first:last]
+
+    def has_range(self, start: date, end: date) -> bool:
+        """Есть ли в файле данные за каждый день диапазона."""
+        self.refresh()
+        if start < self.start_date or self._day_offset(end) >= self.days:
+            return False
+        # у записанного дня значения >= 0, у пропуска — MISSING
+        return MISSING not in self.column("posts", start, end)[:: self._row_size]
+
+    def channel_range(
+        self, channel: str, start: date, end: date
+    ) -> Optional[Tuple[Tuple[int, int, int], List[date]]]:
+        """
+        Суммы (posts, views, forwards) по каналу за те дни диапазона,
+        что есть в файле, и список дней, которых в файле нет
+        (их нужно добрать из API). None, если канала нет в файле.
+        """
+        ch = self._channel_index.get(channel)
+        if ch is None:
+            return None
+        self.refresh()
+
+        missing: List[date] = []
+        first = max(start, self.start_date)
+        last = min(end, self.start_date + timedelta(days=self.days - 1))
+
+        # дни до начала истории
+        cur = start
+        while cur < first and cur <= end:
+            missing.append(cur)
+            cur += timedelta(days=1)
+
+        totals = [0, 0, 0]
+        if first <= last:
+            step = self._row_size
+            posts, views, forwards = (
+                self.column(name, first, last)[ch::step] for name in COLUMNS
+            )
+            if MISSING not in posts:
+                # весь кусок записан — суммируем срезы целиком
+                totals = [sum(posts), sum(views), sum(forwards)]
+            else:
+                for i, day_posts in enumerate(posts):
+                    if day_posts == MISSING:
+                        missing.append(first + timedelta(days=i))
+                        continue
+                    totals[0] += day_posts
+                    totals[1] += views[i]
+                    totals[2] += forwards[i]
+
+        # дни после конца файла
+        cur = max(first, last + timedelta(days=1))
+        while cur <= end:
+            missing.append(cur)
+            cur += timedelta(days=1)
+
+        return (totals[0], totals[1], totals[2]), missing
+
+    def day_stats(self, for_date: date) -> Optional[List[Dict[str, Any]]]:
+        """День в том же виде, что возвращает HseApiClient.get_channel_stats."""
+        if not self.has_range(for_date, for_date):
+            return None
+        posts, views, forwards = (
+            self.column(name, for_date, for_date) for name in COLUMNS
+        )
+        return [
+            {
+                "channel_name": name,
+                "total_posts": posts[i],
+                "total_views": views[i],
+                "total_forwards": forwards[i],
+            }
+            for i, name in enumerate(self.channels)
+        ]
+
+    # ===== Запись =====
+
+    def append_day(self, for_date: date, data: Iterable[Dict[str, Any]]) -> bool:
+        """
+        Записать результат get_channel_stats за день.
+        Дни после конца файла дописываются (пропуски заполняются MISSING),
+        уже существующий день перезаписывается на месте.
+        Даты раньше start_date и ответы без единого известного канала
+        (пустой ответ, данные ещё не готовы) не сохраняются — возвращаем False,
+        иначе день навсегда остался бы нулевым.
+        """
+        day = self._day_offset(for_date)
+        if day < 0:
+            return False
+
+        rows = {column: array(ITEM_FORMAT, [0] * self._row_size) for column in COLUMNS}
+        known_channels = 0
+        for item in data:
+            ch = self._channel_index.get(item.get("channel_name"))
+            if ch is None:
+                continue
+            known_channels += 1
+            rows["posts"][ch] = item["total_posts"]
+            rows["views"][ch] = item["total_views"]
+            rows["forwards"][ch] = item["total_forwards"]
+        if not known_channels:
+            return False
+
+        row_bytes = self._row_size * ITEM_SIZE
+        # несколько процессов (воркеров) могут писать в один файл
+        with open(os.path.join(self.path, META_FILE), "rb") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                for column in COLUMNS:
+                    with open(history_column_path(self.path, column), "r+b") as f:
+                        days_on_disk = os.fstat(f.fileno()).st_size // row_bytes
+                        if day > days_on_disk:
+                            f.seek(days_on_disk * row_bytes)
+                            gap = array(
+                                ITEM_FORMAT,
+                                [MISSING] * (self._row_size * (day - days_on_disk)),
+                            )
+                            f.write(gap.tobytes())
+                        f.seek(day * row_bytes)
+                        f.write(rows[column].tobytes())
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+        self.refresh()
+        return True
+
+
+def history_channel_range(
+    path: str, channel: str, start: date, end: date
+) -> Optional[Tuple[Tuple[int, int, int], List[date]]]:
+    """
+    То же, что StatsHistory.channel_range, но по пути к каталогу —
+    чтобы считать в пуле процессов без передачи mmap между процессами.
+    """
+    history = StatsHistory.open(path)
+    try:
+        return history.channel_range(channel, start, end)
+    finally:
+        history.close()
+
+
+def history_column_path(path: str, column: str) -> str:
+    return os.path.join(path, f"{column}.i64")
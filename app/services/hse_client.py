@@ -1,28 +1,48 @@
 import ssl
+import time
 from datetime import date
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 import aiohttp
 import certifi
 from aiohttp import BasicAuth
 
 from app.config import Config
+from app.services.tracing import TraceRecorder
 
 
 class HseApiClient:
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, recorder: Optional[TraceRecorder] = None):
         self._base_url = config.api.base_url
         self._auth = BasicAuth(config.api.user, config.api.password)
         self._ssl_context = ssl.create_default_context(cafile=certifi.where())
+        self._recorder = recorder
 
     async def get_channel_stats(self, for_date: date) -> List[Dict[str, Any]]:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                self._base_url,
-                params={"date": for_date.isoformat()},
-                auth=self._auth,
-                ssl=self._ssl_context,
-            ) as resp:
-                if resp.status != 200:
-                    raise RuntimeError(f"API error: HTTP {resp.status}")
-                return await resp.json()
+        started = time.monotonic()
+        status = None
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.get(
+                    self._base_url,
+                    params={"date": for_date.isoformat()},
+                    auth=self._auth,
+                    ssl=self._ssl_context,
+                ) as resp:
+                    status = resp.status
+                    if resp.status != 200:
+                        raise RuntimeError(f"API error: HTTP {resp.status}")
+                    data = await resp.json()
+        except Exception as e:
+            # таймауты и ошибки соединения тоже пишем, чтобы replay их повторил
+            if self._recorder:
+                self._recorder.record_api_call(
+                    for_date, time.monotonic() - started, status, error=str(e)
+                )
+            raise
+
+        if self._recorder:
+            self._recorder.record_api_call(
+                for_date, time.monotonic() - started, status, data
+            )
+        return data
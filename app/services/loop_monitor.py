@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# всё, что лежит в пакете app, считаем "нашим" кодом при поиске виновника
+_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _task_label(task: asyncio.Task) -> str:
+    # имена вида Task-123 ничего не говорят, поэтому группируем по корутине
+    coro = task.get_coro()
+    return getattr(coro, "__qualname__", None) or task.get_name()
+
+
+def _culprit(frames: List[traceback.FrameSummary]) -> str:
+    """Самый глубокий кадр из кода бота — обычно это и есть тормозящий хендлер."""
+    for frame in reversed(frames):
+        if frame.filename.startswith(_APP_DIR) and not frame.filename.endswith(
+            "loop_monitor.py"
+        ):
+            return f"{frame.name} ({frame.filename}:{frame.lineno})"
+    if frames:
+        frame = frames[-1]
+        return f"{frame.name} ({frame.filename}:{frame.lineno})"
+    return "unknown"
+
+
+class LoopMonitor:
+    """
+    Следит за здоровьем event loop:
+    - lag: насколько позже положенного просыпается asyncio.sleep;
+    - медленные колбэки: отдельный поток пингует loop и, если тот не
+      отвечает дольше slow_callback_threshold, снимает стек потока loop
+      и пишет в лог, какой хендлер его занял;
+    - перепись задач: раз в census_interval считает pending-задачи по корутинам.
+
+    Текущие значения доступны через snapshot() для метрик.
+    """
+
+    def __init__(
+        self,
+        interval: float = 0.5,
+        slow_callback_threshold: float = 0.1,
+        lag_slo: float = 0.2,
+        census_interval: float = 60.0,
+    ):
+        self._interval = interval
+        self._slow_threshold = slow_callback_threshold
+        self._lag_slo = lag_slo
+        self._census_interval = census_interval
+
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.slo_violations = 0
+        self.slow_callbacks = 0
+        self.last_slow_callback: Optional[str] = None
+        self.task_census: Dict[str, int] = {}
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._tasks: List[asyncio.Task] = []
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._stopped.clear()
+        self._tasks = [
+            asyncio.create_task(self._lag_loop(), name="loop-monitor:lag"),
+            asyncio.create_task(self._census_loop(), name="loop-monitor:census"),
+        ]
+        self._watchdog = threading.Thread(
+            target=self._watchdog_loop, name="loop-monitor:watchdog", daemon=True
+        )
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stopped.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=self._slow_threshold * 2 + 1)
+            self._watchdog = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "loop_lag": self.lag,
+            "loop_lag_max": self.max_lag,
+            "loop_lag_slo_violations": self.slo_violations,
+            "slow_callbacks": self.slow_callbacks,
+            "last_slow_callback": self.last_slow_callback,
+            "tasks": dict(self.task_census),
+        }
+
+    # ===== Lag =====
+
+    async def _lag_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self._interval)
+            self.lag = max(0.0, loop.time() - started - self._interval)
+            self.max_lag = max(self.max_lag, self.lag)
+            if self.lag > self._lag_slo:
+                self.slo_violations += 1
+                logger.warning(
+                    "Event loop lag %.0f ms exceeds SLO %.0f ms",
+                    self.lag * 1000,
+                    self._lag_slo * 1000,
+                )
+
+    # ===== Перепись задач =====
+
+    def take_census(self) -> Dict[str, int]:
+        census = Counter(
+            _task_label(task) for task in asyncio.all_tasks() if not task.done()
+        )
+        self.task_census = dict(census)
+        return self.task_census
+
+    async def _census_loop(self):
+        while True:
+            await asyncio.sleep(self._census_interval)
+            census = self.take_census()
+            logger.info(
+                "Pending tasks: %s total, top: %s",
+                sum(census.values()),
+                ", ".join(
+                    f"{name}={count}"
+                    for name, count in Counter(census).most_common(5)
+                ),
+            )
+
+    # ===== Медленные колбэки (в отдельном потоке) =====
+
+    def _loop_stack(self) -> List[traceback.FrameSummary]:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return []
+        return traceback.extract_stack(frame)
+
+    def _watchdog_loop(self):
+        while not self._stopped.wait(self._slow_threshold / 2):
+            pong = threading.Event()
+            try:
+                self._loop.call_soon_threadsafe(pong.set)
+            except RuntimeError:
+                # loop уже закрыт
+                return
+            sent = time.monotonic()
+            if pong.wait(self._slow_threshold):
+                continue
+            if self._stopped.is_set():
+                return
+
+            # loop не ответил за порог — смотрим, чем он занят прямо сейчас
+            stack = self._loop_stack()
+            culprit = _culprit(stack)
+            self.slow_callbacks += 1
+            self.last_slow_callback = culprit
+            logger.warning(
+                "Event loop blocked for more than %.0f ms in %s\n%s",
+                self._slow_threshold * 1000,
+                culprit,
+                "".join(traceback.format_list(stack[-10:])),
+            )
+
+            while not pong.wait(self._slow_threshold):
+                if self._stopped.is_set():
+                    return
+            logger.warning(
+                "Event loop was blocked for %.0f ms in %s",
+                (time.monotonic() - sent) * 1000,
+                culprit,
+            )
@@ -0,0 +1,53 @@
+import asyncio
+import multiprocessing as mp
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional
+
+EXECUTOR_KINDS = ("inline", "thread", "process")
+
+
+class ReportExecutor:
+    """
+    Выносит тяжёлую агрегацию и сборку отчётов с event loop в пул.
+
+    kind:
+    - "inline"  — всё считается прямо в loop (как раньше);
+    - "thread"  — ThreadPoolExecutor;
+    - "process" — ProcessPoolExecutor, функция и аргументы должны
+      пикаться, поэтому в пул передаём компактные кортежи, а не словари API.
+
+    Маленькие задачи (size < threshold, size — сколько чисел агрегируем)
+    считаются inline: пересылка в пул для них дороже самой работы.
+    """
+
+    def __init__(self, kind: str = "inline", max_workers: Optional[int] = None,
+                 threshold: int = 10000):
+        if kind not in EXECUTOR_KINDS:
+            raise ValueError(f"Unknown executor kind: {kind}")
+        self.kind = kind
+        self.threshold = threshold
+        self._pool: Optional[Executor] = None
+        if kind == "thread":
+            self._pool = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="report"
+            )
+        elif kind == "process":
+            # spawn: форкать процесс с запущенным loop и потоками небезопасно
+            self._pool = ProcessPoolExecutor(
+                max_workers=max_workers, mp_context=mp.get_context("spawn")
+            )
+
+    def offloads(self, size: int) -> bool:
+        return self._pool is not None and size >= self.threshold
+
+    async def run(self, func: Callable[..., Any], *args: Any, size: int) -> Any:
+        if not self.offloads(size):
+            return func(*args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, partial(func, *args))
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
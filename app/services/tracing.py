@@ -0,0 +1,88 @@
+import json
+import time
+from datetime import date
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+
+class TraceRecorder:
+    """
+    Пишет реальный трафик в JSONL-файл: входящие апдейты и пары
+    запрос/ответ к HSE API с временем. Потом этот файл можно
+    проиграть через app.replay.
+
+    Каждая строка — событие с абсолютным временем "ts" (time.time()),
+    поэтому несколько процессов могут дописывать в один файл.
+    """
+
+    def __init__(self, path: str):
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _write(self, event: Dict[str, Any]):
+        event["ts"] = time.time()
+        self._file.write(json.dumps(event, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def record_update(self, raw_update: Dict[str, Any]):
+        self._write({"kind": "update", "update": raw_update})
+
+    def record_api_call(
+        self,
+        for_date: date,
+        duration: float,
+        status: Optional[int],
+        response: Any = None,
+        error: Optional[str] = None,
+    ):
+        """
+        status=None и error — запрос не дошёл до ответа (таймаут, обрыв);
+        error хранит текст исключения, который увидел бы пользователь.
+        """
+        # дату храним относительно "сегодня", чтобы при проигрывании
+        # в другой день бот запрашивал те же самые относительные даты
+        self._write(
+            {
+                "kind": "api",
+                "days_ago": (date.today() - for_date).days,
+                "duration": duration,
+                "status": status,
+                "response": response,
+                "error": error,
+            }
+        )
+
+    def close(self):
+        self._file.close()
+
+
+class TraceUpdateMiddleware(BaseMiddleware):
+    """Outer-middleware на update: записывает каждый входящий апдейт."""
+
+    def __init__(self, recorder: TraceRecorder):
+        self._recorder = recorder
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        self._recorder.record_update(
+            event.model_dump(mode="json", by_alias=True, exclude_none=True)
+        )
+        return await handler(event, data)
+
+
+def read_trace(path: str) -> List[Dict[str, Any]]:
+    """Читает трейс и сортирует события по времени."""
+    return sorted(_iter_events(path), key=lambda event: event["ts"])
+
+
+def _iter_events(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
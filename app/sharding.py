@@ -0,0 +1,308 @@
+import asyncio
+import bisect
+import hashlib
+import logging
+import multiprocessing as mp
+import queue
+import signal
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# сколько виртуальных узлов на одного воркера в кольце
+RING_REPLICAS = 160
+# как часто воркер отмечается в heartbeat и как часто супервизор его проверяет
+HEARTBEAT_INTERVAL = 2.0
+HEALTH_CHECK_INTERVAL = 5.0
+# если воркер молчит дольше этого — считаем его зависшим и перезапускаем
+HEARTBEAT_TIMEOUT = 30.0
+# перезапуск с экспоненциальной задержкой, чтобы воркер, падающий
+# на старте (например, из-за конфига), не перезапускался бесконечно часто
+RESTART_BACKOFF_BASE = 1.0
+RESTART_BACKOFF_MAX = 300.0
+# если воркер прожил дольше этого — считаем, что он стабилен, и сбрасываем счётчик
+RESTART_RESET_AFTER = 60.0
+
+_QUEUE_POLL_TIMEOUT = 1.0
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Консистентное хеширование chat_id -> номер воркера.
+    Один и тот же чат всегда попадает в один и тот же воркер,
+    поэтому FSM-состояние (MemoryStorage) и порядок апдейтов чата
+    остаются внутри одного процесса.
+    """
+
+    def __init__(self, nodes: int, replicas: int = RING_REPLICAS):
+        self._points: List[int] = []
+        self._owners: List[int] = []
+        ring = sorted(
+            (_hash(f"worker-{node}#{r}"), node)
+            for node in range(nodes)
+            for r in range(replicas)
+        )
+        for point, node in ring:
+            self._points.append(point)
+            self._owners.append(node)
+
+    def get_node(self, chat_id: int) -> int:
+        idx = bisect.bisect(self._points, _hash(str(chat_id)))
+        if idx == len(self._points):
+            idx = 0
+        return self._owners[idx]
+
+
+def extract_chat_id(raw_update: Dict[str, Any]) -> int:
+    """Достаёт chat_id из сырого апдейта (message, callback_query и т.д.)."""
+    for value in raw_update.values():
+        if not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        user = value.get("from") or value.get("user")
+        if user:
+            return user["id"]
+    # апдейты без чата (например, poll) раскидываем по update_id
+    return raw_update["update_id"]
+
+
+# ===== Воркер =====
+
+_EMPTY = object()
+
+
+def _queue_get(updates_queue) -> Any:
+    try:
+        return updates_queue.get(timeout=_QUEUE_POLL_TIMEOUT)
+    except queue.Empty:
+        return _EMPTY
+
+
+async def _heartbeat_loop(heartbeat):
+    while True:
+        heartbeat.value = time.time()
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+
+async def _worker_loop(index: int, updates_queue, heartbeat, build_dispatcher):
+    from aiogram import Bot
+
+    from app.config import load_config
+    from app.main import build_loop_monitor
+
+    config = load_config()
+    bot = Bot(token=config.bot.token)
+    dp = build_dispatcher(config)
+    monitor = build_loop_monitor(config)
+    monitor.start()
+
+    loop = asyncio.get_running_loop()
+    # sentinel родителя: работает, даже если супервизор умер раньше, чем мы стартовали
+    supervisor = mp.parent_process()
+    heartbeat_task = asyncio.create_task(_heartbeat_loop(heartbeat))
+    # как и в обычном polling, каждый апдейт обрабатывается отдельной задачей
+    tasks = set()
+
+    logger.info("Worker %s started", index)
+    try:
+        while True:
+            raw_update = await loop.run_in_executor(None, _queue_get, updates_queue)
+            if raw_update is _EMPTY:
+                # супервизор умер (например, kill -9) — новых апдейтов не будет
+                if supervisor is not None and not supervisor.is_alive():
+                    logger.warning("Worker %s lost its supervisor, stopping", index)
+                    break
+                continue
+            if raw_update is None:
+                break
+            task = asyncio.create_task(dp.feed_raw_update(bot, raw_update))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        # дожидаемся фоновых отчётов и гасим пул так же, как run_bot
+        await dp.emit_shutdown(bot=bot)
+        heartbeat_task.cancel()
+        await monitor.stop()
+        await bot.session.close()
+        logger.info("Worker %s stopped", index)
+
+
+def _worker_main(index: int, updates_queue, heartbeat, build_dispatcher):
+    logging.basicConfig(level=logging.INFO)
+    # Ctrl-C и systemctl stop шлют сигнал всей группе процессов.
+    # Воркер останавливает только супервизор (через None в очереди),
+    # иначе недосчитанные фоновые отчёты потерялись бы.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    asyncio.run(_worker_loop(index, updates_queue, heartbeat, build_dispatcher))
+
+
+# ===== Супервизор =====
+
+class ShardSupervisor:
+    """
+    Запускает N процессов-воркеров, сам забирает апдейты через getUpdates
+    и раздаёт их воркерам по chat_id. Следит за здоровьем воркеров:
+    упавший или зависший процесс перезапускается в тот же слот
+    с экспоненциальной задержкой.
+
+    Убитый процесс мог умереть внутри queue.get() и не отпустить
+    блокировку чтения mp.Queue, поэтому при перезапуске слот получает
+    новую очередь, а апдейты из старой отбрасываются.
+    """
+
+    def __init__(self, workers: int, build_dispatcher: Callable):
+        if workers < 1:
+            raise ValueError("workers must be >= 1")
+        self._workers = workers
+        self._build_dispatcher = build_dispatcher
+        self._ctx = mp.get_context("spawn")
+        self._ring = HashRing(workers)
+        self._queues = [self._ctx.Queue() for _ in range(workers)]
+        self._heartbeats = [self._ctx.Value("d", 0.0) for _ in range(workers)]
+        self._processes: List[Optional[mp.Process]] = [None] * workers
+        self._started_at = [0.0] * workers
+        self._failures = [0] * workers
+        # когда можно снова запустить воркер слота (None — он работает)
+        self._restart_at: List[Optional[float]] = [None] * workers
+        self.restarts = [0] * workers
+
+    def _start_worker(self, index: int):
+        self._restart_at[index] = None
+        self._started_at[index] = time.time()
+        self._heartbeats[index].value = time.time()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(
+                index,
+                self._queues[index],
+                self._heartbeats[index],
+                self._build_dispatcher,
+            ),
+            name=f"bot-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        self._processes[index] = process
+
+    def start(self):
+        for index in range(self._workers):
+            self._start_worker(index)
+
+    def dispatch(self, raw_update: Dict[str, Any]):
+        index = self._ring.get_node(extract_chat_id(raw_update))
+        self._queues[index].put(raw_update)
+
+    def _replace_queue(self, index: int):
+        old_queue = self._queues[index]
+        self._queues[index] = self._ctx.Queue()
+        try:
+            dropped = old_queue.qsize()
+        except NotImplementedError:
+            dropped = "unknown number of"
+        if dropped:
+            logger.warning(
+                "Dropped %s pending updates of worker %s", dropped, index
+            )
+        # читать старую очередь нельзя — её блокировка могла остаться занятой
+        old_queue.cancel_join_thread()
+        old_queue.close()
+
+    def check_health(self):
+        now = time.time()
+        for index, process in enumerate(self._processes):
+            if process is None:
+                restart_at = self._restart_at[index]
+                if restart_at is not None and now >= restart_at:
+                    self.restarts[index] += 1
+                    self._start_worker(index)
+                continue
+
+            stale = now - self._heartbeats[index].value > HEARTBEAT_TIMEOUT
+            if process.is_alive() and not stale:
+                continue
+
+            if process.is_alive():
+                logger.warning("Worker %s is not responding, killing it", index)
+                process.kill()
+            else:
+                logger.warning(
+                    "Worker %s exited with code %s", index, process.exitcode
+                )
+            process.join(timeout=5)
+            self._processes[index] = None
+            self._replace_queue(index)
+
+            if now - self._started_at[index] >= RESTART_RESET_AFTER:
+                self._failures[index] = 0
+            self._failures[index] += 1
+            delay = min(
+                RESTART_BACKOFF_BASE * 2 ** (self._failures[index] - 1),
+                RESTART_BACKOFF_MAX,
+            )
+            logger.warning("Restarting worker %s in %.1f s", index, delay)
+            self._restart_at[index] = now + delay
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+            self.check_health()
+
+    def stop(self, timeout: float = 10.0):
+        for updates_queue in self._queues:
+            updates_queue.put(None)
+        for process in self._processes:
+            if process is None:
+                continue
+            process.join(timeout=timeout)
+            if process.is_alive():
+                process.kill()
+
+    async def run_polling(self, bot, allowed_updates=None, polling_timeout: int = 10):
+        self.start()
+        health_task = asyncio.create_task(self._health_loop())
+
+        # по SIGINT/SIGTERM прерываем polling и штатно гасим воркеров
+        loop = asyncio.get_running_loop()
+        polling_task = asyncio.current_task()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, polling_task.cancel)
+
+        offset = None
+        try:
+            while True:
+                try:
+                    updates = await bot.get_updates(
+                        offset=offset,
+                        timeout=polling_timeout,
+                        allowed_updates=allowed_updates,
+                        request_timeout=polling_timeout + 10,
+                    )
+                except Exception as e:
+                    logger.error("Failed to fetch updates: %s", e)
+                    await asyncio.sleep(1)
+                    continue
+
+                for update in updates:
+                    offset = update.update_id + 1
+                    self.dispatch(
+                        update.model_dump(
+                            mode="json", by_alias=True, exclude_none=True
+                        )
+                    )
+        except asyncio.CancelledError:
+            logger.info("Supervisor is stopping")
+        finally:
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.remove_signal_handler(sig)
+            health_task.cancel()
+            self.stop()
@@ -1,16 +1,15 @@
 # app/main.py
 import asyncio
+import logging
 import os
 from datetime import date, timedelta
 
-from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram import Bot
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 from app.config import load_config
-from app.handlers import start as start_handlers
-from app.handlers import stats as stats_handlers
 from app.handlers.stats import build_total_stats_text
+from app.main import build_dispatcher, build_loop_monitor
 from app.services.hse_client import HseApiClient
 
 
@@ -44,10 +43,13 @@ async def send_hourly_report(bot: Bot, api_client: HseApiClient, target_chat_id:
 
 
 async def run_bot():
+    logging.basicConfig(level=logging.INFO)
     config = load_config()
 
     bot = Bot(token=config.bot.token)
-    dp = Dispatcher(storage=MemoryStorage())
+    # тот же диспетчер, что и в app.main: история, пул отчётов, трейс
+    # и ожидание фоновых ответов при остановке
+    dp = build_dispatcher(config)
 
     api_client = HseApiClient(config)
 
@@ -72,13 +74,15 @@ async def run_bot():
     else:
         print("REPORT_CHAT_ID is not set; scheduler job NOT scheduled.")
 
-    # === Роутеры ===
-    dp.include_router(start_handlers.router)
-    stats_handlers.setup_stats_handlers(
-        stats_handlers.router, api_client, config)
-    dp.include_router(stats_handlers.router)
-
-    await dp.start_polling(bot)
+    # === Монитор event loop ===
+    monitor = build_loop_monitor(config)
+    monitor.start()
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await monitor.stop()
+        if scheduler.running:
+            scheduler.shutdown(wait=False)
 
 
 if __name__ == "__main__":